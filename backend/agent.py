@@ -5,12 +5,16 @@ This module implements the core AI agent using OpenAI's API with streaming.
 The agent is stateless and supports both Hebrew and English.
 """
 
-import json
-from typing import List, Dict, AsyncGenerator
+import asyncio
+from contextlib import aclosing
+import httpx
+import orjson
+import re
+from typing import List, Dict, AsyncGenerator, Optional
 from openai import AsyncOpenAI
 import os
 from dotenv import load_dotenv
-from tools import TOOLS, TOOL_FUNCTIONS
+from tools import TOOLS, TOOL_FUNCTIONS, BATCH_TOOL_FUNCTIONS
 
 load_dotenv()
 
@@ -18,8 +22,15 @@ load_dotenv()
 if not os.getenv("OPENAI_API_KEY"):
     raise RuntimeError("OPENAI_API_KEY is not set")
     
+# Shared HTTP/2 connection pool so concurrent streams reuse sockets
+_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=httpx.Timeout(60.0, connect=5.0)
+)
+
 # Initialize OpenAI client
-client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=_http)
 
 # System prompt - defines the agent's behavior and policies
 SYSTEM_PROMPT = """You are a pharmacy information assistant. You provide factual medication information, stock availability, and prescription status.
@@ -29,7 +40,7 @@ CRITICAL RULES:
 2. Do NOT write filler text like "checking database", "retrieving info", etc.
 3. After tools execute, provide a direct, concise answer IMMEDIATELY
 4. Write naturally in flowing sentences (not bullet points)
-5. LANGUAGE: Respond in the EXACT language the user is currently writing in their messages. Ignore the user's name or profile - only look at their actual message text. If they write in English, respond in English. If they write in Hebrew, respond in Hebrew. NEVER switch languages mid-conversation unless the user does
+5. LANGUAGE: Follow the language instruction that comes after the conversation
 
 REQUIREMENTS - You MUST be able to:
 1. Provide factual information about medications
@@ -65,17 +76,198 @@ CRITICAL - Tool usage rules:
   • Prescription: "Do I need a prescription?", "Do I have a prescription?" → Use check_prescription
   • Search: "What pain relievers do you have?" → Use search_medications
 
-Examples:
-  ✗ "Should I take Advil for my headache?" → NO TOOLS, immediate "I cannot provide medical advice"
-  ✗ "What medication should I take for pain?" → NO TOOLS, immediate "I cannot recommend medications"
-  ✓ "What is Advil?" → Use get_medication_by_name (share all factual info including dosage, usage, side effects)
-  ✓ "What's the Advil dosage?" → Use get_medication_by_name (share dosage as factual label information)
-  ✓ "What's in Acamol?" → Use get_medication_by_name
-  ✓ "Do you have Advil in stock?" → Use check_medication_stock
+IMPORTANT: Always call tools with English medication names."""
+
+# Static request prefix - built once so every call starts with the same bytes,
+# which keeps OpenAI's prefix cache warm across iterations and requests
+_SYS_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Request parameters shared by every call
+# Always send tools - dropping them changes the prefix and breaks caching
+_BASE_PARAMS = {"tools": TOOLS, "stream": True}
+
+# Unambiguous medical-advice questions get a fixed refusal without calling the
+# API. Anything less clear-cut is left to the model, which has the full policy;
+# a false positive here is a wrong answer with no fallback.
+# Refused:  "Should I take Augmentin?", "What should I take for a headache?",
+#           "Is Advil safe for me?", "האם כדאי לי לקחת אדוויל?", "מה כדאי לקחת לכאב ראש?"
+# To model: "What dosage should I take?", "Should I take Advil with food?",
+#           "Should I take Augmentin with food for my sore throat?",
+#           "How many Acamol should I take?", "Is this in stock? it is safe for me"
+# Checked one sentence at a time, so a match never spans unrelated sentences
+_MEDICAL_ADVICE_PATTERNS = re.compile(
+    # The whole sentence is the question, e.g. "Should I take Augmentin"
+    r"(?i)^\s*(?:should i take [\w-]+|is [\w-]+ safe for me|האם כדאי לי לקחת [\w-]+)\s*$"
+    # Asking for a recommendation for a symptom
+    r"|\bwhat should i take for\b|מה כדאי לקחת"
+)
+
+_SENTENCE_END_RE = re.compile(r"[.?!\n]+")
+
+_HEBREW_RE = re.compile(r"[\u0590-\u05FF]")
+
+# Terse per-request language instruction, appended after the conversation
+# so the cached system prefix is the same for every language
+LANGUAGE_HINTS = {
+    "en": {"role": "system", "content": "Respond in English."},
+    "he": {"role": "system", "content": "Respond in Hebrew."},
+}
+
+# Hebrew medication names, applied to streamed content when responding in Hebrew
+HEBREW_NAMES = {
+    "Acamol": "אקמול",
+    "Advil": "אדוויל",
+    "Augmentin": "אוגמנטין",
+    "Lipitor": "ליפיטור",
+    "Benadryl": "בנדריל",
+}
+
+_HEBREW_NAMES_LOWER = {name.lower(): hebrew for name, hebrew in HEBREW_NAMES.items()}
+_ENGLISH_NAMES = {hebrew: name for name, hebrew in HEBREW_NAMES.items()}
+_HEBREW_NAME_RE = re.compile("|".join(HEBREW_NAMES), re.IGNORECASE)
+
+MEDICAL_ADVICE_RESPONSES = {
+    "en": (
+        "I'm sorry, but I can't provide medical advice or recommend whether you should take a medication. "
+        "Please consult a doctor or pharmacist. I'm happy to share factual information about medications, "
+        "such as active ingredients, label dosage, stock availability, or prescription requirements."
+    ),
+    "he": (
+        "מצטער, אינני יכול לתת ייעוץ רפואי או להמליץ אם כדאי לך ליטול תרופה. "
+        "אנא התייעץ עם רופא או רוקח. אשמח לספק מידע עובדתי על תרופות, "
+        "כמו רכיבים פעילים, מינון לפי העלון, זמינות במלאי או דרישת מרשם."
+    ),
+}
+
+def _latest_user_content(messages: List[Dict[str, str]]) -> str:
+    """Get the text of the most recent user message"""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+def _detect_language(text: str) -> str:
+    """Detect the response language from the user's text ("he" or "en")"""
+    return "he" if _HEBREW_RE.search(text) else "en"
+
+def _medical_advice_response(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Return the canned refusal if the latest user message asks for medical advice"""
+    if not messages or messages[-1].get("role") != "user":
+        return None
+
+    content = messages[-1].get("content") or ""
+    for sentence in _SENTENCE_END_RE.split(content):
+        if _MEDICAL_ADVICE_PATTERNS.search(sentence):
+            return MEDICAL_ADVICE_RESPONSES[_detect_language(content)]
+
+    return None
+
+class _NameTranslator:
+    """
+    Replace English medication names with their Hebrew names in streamed text.
+
+    A trailing fragment that could be the start of a name split across
+    deltas is held back until the next delta (or flush) resolves it.
+    """
+
+    _max_hold = max(len(name) for name in HEBREW_NAMES) - 1
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        text = _HEBREW_NAME_RE.sub(
+            lambda match: _HEBREW_NAMES_LOWER[match.group(0).lower()],
+            self._pending + text
+        )
+
+        hold = 0
+        for size in range(1, min(len(text), self._max_hold) + 1):
+            suffix = text[-size:].lower()
+            if any(name.startswith(suffix) for name in _HEBREW_NAMES_LOWER):
+                hold = size
+
+        self._pending = text[len(text) - hold:] if hold else ""
+        return text[:len(text) - hold]
+
+    def flush(self) -> str:
+        pending, self._pending = self._pending, ""
+        return pending
+
+async def _stream_chunks(api_params: Dict) -> AsyncGenerator[Dict, None]:
+    """
+    Stream chat completion chunks as plain dicts.
+
+    Reads the raw SSE lines off the HTTP response and decodes them with
+    orjson, skipping the SDK's per-chunk Pydantic models.
+    """
+    async with client.chat.completions.with_streaming_response.create(**api_params) as response:
+        async for line in response.iter_lines():
+            if not line.startswith('data:'):
+                continue
 
-Hebrew names: Acamol→אקמול, Advil→אדוויל, Augmentin→אוגמנטין, Lipitor→ליפיטור, Benadryl→בנדריל
+            data = line[5:].strip()
+            if data == '[DONE]':
+                return
 
-IMPORTANT: Call tools with English names, respond with Hebrew names if user speaks Hebrew."""
+            chunk = orjson.loads(data)
+            if 'error' in chunk:
+                raise RuntimeError(chunk['error'].get('message', 'OpenAI stream error'))
+            yield chunk
+
+def _dump_json(obj) -> str:
+    """Serialize to JSON deterministically so history stays byte-stable"""
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+async def _execute_tool_calls(pending_calls: List[tuple]) -> List[Dict]:
+    """
+    Execute tool calls concurrently in worker threads so the blocking
+    SQLite queries don't stall the event loop.
+
+    Several calls to the same batchable tool are served by one query.
+
+    Args:
+        pending_calls: (tool_call, function_name, function_args) tuples
+
+    Returns:
+        Tool results in the same order as pending_calls
+    """
+    # Group batchable calls by tool, everything else runs on its own
+    batches: Dict[str, List[int]] = {}
+    singles = []
+    for i, (_, function_name, function_args) in enumerate(pending_calls):
+        if function_name in BATCH_TOOL_FUNCTIONS and list(function_args) == ['medication_name']:
+            batches.setdefault(function_name, []).append(i)
+        else:
+            singles.append(i)
+
+    # A batch of one is cheaper through the regular tool (both share one cache)
+    for function_name in list(batches):
+        if len(batches[function_name]) == 1:
+            singles.extend(batches.pop(function_name))
+
+    single_results, batch_results = await asyncio.gather(
+        asyncio.gather(*[
+            asyncio.to_thread(TOOL_FUNCTIONS[pending_calls[i][1]], **pending_calls[i][2])
+            for i in singles
+        ]),
+        asyncio.gather(*[
+            asyncio.to_thread(
+                BATCH_TOOL_FUNCTIONS[function_name],
+                [pending_calls[i][2]['medication_name'] for i in indexes]
+            )
+            for function_name, indexes in batches.items()
+        ])
+    )
+
+    # Fan results back out to their original positions
+    results = [None] * len(pending_calls)
+    for i, result in zip(singles, single_results):
+        results[i] = result
+    for indexes, batch in zip(batches.values(), batch_results):
+        for i, result in zip(indexes, batch):
+            results[i] = result
+    return results
 
 async def run_agent_streaming(
     messages: List[Dict[str, str]],
@@ -86,53 +278,67 @@ async def run_agent_streaming(
     Supports multiple rounds of tool calling until final response.
 
     Args:
-        messages: List of conversation messages
+        messages: List of conversation messages (not modified - tool turns
+            are appended to an internal copy built once per request)
         model: OpenAI model to use (default: gpt-5-mini)
 
     Yields:
         Chunks of the streaming response
     """
+    # Answer medical-advice questions locally, without an API round trip
+    refusal = _medical_advice_response(messages)
+    if refusal:
+        yield {
+            'type': 'content',
+            'content': refusal
+        }
+        yield {
+            'type': 'done'
+        }
+        return
+
     # Keep processing until we get a final response
     max_iterations = 10  # Prevent infinite loops
     iteration = 0
 
+    # Language is decided in code rather than by the model
+    language = _detect_language(_latest_user_content(messages))
+    translator = _NameTranslator() if language == "he" else None
+
+    # Build the history once per request: the static prefix stays at the head
+    # and tool turns are appended in place at the tail
+    full_messages = [_SYS_MSG, *messages, LANGUAGE_HINTS[language]]
+
     while iteration < max_iterations:
         iteration += 1
 
-        # Add system prompt
-        full_messages = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ] + messages
-
         # Call OpenAI API with streaming
-        # Only include tools on the first iteration
-        api_params = {
-            "model": model,
-            "messages": full_messages,
-            "stream": True
-        }
-
-        # Add tools only on first iteration to allow tool calling
-        if iteration == 1:
-            api_params["tools"] = TOOLS
+        api_params = {**_BASE_PARAMS, "model": model, "messages": full_messages}
 
-        stream = await client.chat.completions.create(**api_params)
+        # On the last iteration keep the same prefix but force a final answer
+        if iteration == max_iterations:
+            api_params["tool_choice"] = "none"
 
-        # Track tool calls for this iteration
-        tool_calls = []
+        # Track tool calls for this iteration, keyed by stream index
+        tool_calls: Dict[int, Dict] = {}
         has_content = False
 
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
+        async with aclosing(_stream_chunks(api_params)) as stream:
+            async for chunk in stream:
+                # Skip chunks without choices (e.g. trailing usage chunks)
+                if not chunk.get('choices'):
+                    continue
 
-            # Handle tool calls
-            if delta.tool_calls:
-                for tool_call_delta in delta.tool_calls:
-                    index = tool_call_delta.index
+                choice = chunk['choices'][0]
+                delta = choice.get('delta') or {}
 
-                    # Initialize tool call if needed
-                    if len(tool_calls) <= index:
-                        tool_calls.append({
+                # Handle tool calls
+                if delta.get('tool_calls'):
+                    for tool_call_delta in delta['tool_calls']:
+                        index = tool_call_delta['index']
+
+                        # Initialize tool call if needed
+                        tool_call = tool_calls.setdefault(index, {
                             'id': '',
                             'type': 'function',
                             'function': {
@@ -141,42 +347,79 @@ async def run_agent_streaming(
                             }
                         })
 
-                    # Update tool call
-                    if tool_call_delta.id:
-                        tool_calls[index]['id'] = tool_call_delta.id
+                        # Update tool call
+                        if tool_call_delta.get('id'):
+                            tool_call['id'] = tool_call_delta['id']
+
+                        function_delta = tool_call_delta.get('function')
+                        if function_delta:
+                            if function_delta.get('name'):
+                                tool_call['function']['name'] = function_delta['name']
+
+                                # Announce the tool call once its name is known
+                                yield {
+                                    'type': 'tool_call_start',
+                                    'index': index,
+                                    'id': tool_call['id'],
+                                    'name': tool_call['function']['name']
+                                }
+
+                            if function_delta.get('arguments'):
+                                tool_call['function']['arguments'] += function_delta['arguments']
+
+                                # Stream only the new piece of the arguments
+                                yield {
+                                    'type': 'tool_call_delta',
+                                    'index': index,
+                                    'arguments_delta': function_delta['arguments']
+                                }
+
+                # Handle content
+                if delta.get('content'):
+                    has_content = True
+                    content = translator.feed(delta['content']) if translator else delta['content']
+                    if content:
+                        yield {
+                            'type': 'content',
+                            'content': content
+                        }
+
+                # Release any name fragment held back by the translator
+                if choice.get('finish_reason') and translator:
+                    content = translator.flush()
+                    if content:
+                        yield {
+                            'type': 'content',
+                            'content': content
+                        }
 
-                    if tool_call_delta.function:
-                        if tool_call_delta.function.name:
-                            tool_calls[index]['function']['name'] = tool_call_delta.function.name
+                # Handle finish
+                if choice.get('finish_reason') == 'tool_calls':
+                    for index in tool_calls:
+                        yield {
+                            'type': 'tool_call_end',
+                            'index': index
+                        }
 
-                        if tool_call_delta.function.arguments:
-                            tool_calls[index]['function']['arguments'] += tool_call_delta.function.arguments
+                    # Collect the tool calls we know how to execute
+                    pending_calls = []
+                    for tool_call in tool_calls.values():
+                        function_name = tool_call['function']['name']
+                        function_args = orjson.loads(tool_call['function']['arguments'])
+                        tool_call['function']['arguments'] = _dump_json(function_args)
 
-                    # Yield tool call update
-                    yield {
-                        'type': 'tool_call',
-                        'tool_call': tool_calls[index]
-                    }
+                        # Tools expect English medication names
+                        if isinstance(function_args.get('medication_name'), str):
+                            name = function_args['medication_name'].strip()
+                            function_args['medication_name'] = _ENGLISH_NAMES.get(name, name)
+
+                        if function_name in TOOL_FUNCTIONS:
+                            pending_calls.append((tool_call, function_name, function_args))
 
-            # Handle content
-            if delta.content:
-                has_content = True
-                yield {
-                    'type': 'content',
-                    'content': delta.content
-                }
-
-            # Handle finish
-            if chunk.choices[0].finish_reason == 'tool_calls':
-                # Execute tool calls
-                for tool_call in tool_calls:
-                    function_name = tool_call['function']['name']
-                    function_args = json.loads(tool_call['function']['arguments'])
-
-                    # Execute the function
-                    if function_name in TOOL_FUNCTIONS:
-                        result = TOOL_FUNCTIONS[function_name](**function_args)
+                    # Execute tool calls concurrently, batching where possible
+                    results = await _execute_tool_calls(pending_calls)
 
+                    for (tool_call, function_name, _), result in zip(pending_calls, results):
                         # Yield tool result
                         yield {
                             'type': 'tool_result',
@@ -186,26 +429,26 @@ async def run_agent_streaming(
                         }
 
                         # Add tool response to messages
-                        messages.append({
+                        full_messages.append({
                             "role": "assistant",
                             "content": None,
                             "tool_calls": [tool_call]
                         })
-                        messages.append({
+                        full_messages.append({
                             "role": "tool",
                             "tool_call_id": tool_call['id'],
-                            "content": json.dumps(result)
+                            "content": _dump_json(result)
                         })
 
-                # Continue to next iteration to get the response
-                break
+                    # Continue to next iteration to get the response
+                    break
 
-            elif chunk.choices[0].finish_reason == 'stop':
-                # Final response received
-                yield {
-                    'type': 'done'
-                }
-                return  # Exit the function completely
+                elif choice.get('finish_reason') == 'stop':
+                    # Final response received
+                    yield {
+                        'type': 'done'
+                    }
+                    return  # Exit the function completely
 
         # If we executed tools, continue the loop to get the next response
         if tool_calls and not has_content:
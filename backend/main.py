@@ -9,16 +9,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
-import json
-import asyncio
+import orjson
 import sqlite3
 import os
 
 from agent import run_agent_streaming
-from tools import get_db_connection
+from tools import get_db_connection, DB_LOCK
 
 app = FastAPI(title="Pharmacy AI Agent API")
 
+# SSE frame delimiters, pre-encoded so frames are yielded as bytes
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -50,16 +53,18 @@ async def health():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+# Sync endpoint on purpose: FastAPI runs it in the threadpool, so waiting on
+# DB_LOCK never blocks the event loop
 @app.get("/users")
-async def get_users():
+def get_users():
     """Get list of all users"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute('SELECT id, name, email FROM users ORDER BY id')
-        users = cursor.fetchall()
-        conn.close()
+        with DB_LOCK:
+            cursor.execute('SELECT id, name, email FROM users ORDER BY id')
+            users = cursor.fetchall()
 
         users_list = [
             {
@@ -87,26 +92,22 @@ async def chat(request: ChatRequest):
     Accepts a list of messages and returns a streaming response.
     """
     try:
-        # Convert Pydantic models to dictionaries
-        messages = [msg.model_dump() for msg in request.messages]
+        # Convert Pydantic models to dictionaries (cheaper than model_dump)
+        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
 
         async def generate():
             """Generator for streaming responses"""
             try:
                 async for chunk in run_agent_streaming(messages, request.model):
                     # Send chunk as Server-Sent Event
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                    await asyncio.sleep(0)  # Allow other tasks to run
-
-                
-               
+                    yield SSE_PREFIX + orjson.dumps(chunk) + SSE_SUFFIX
 
             except Exception as e:
                 error_chunk = {
                     'type': 'error',
                     'error': str(e)
                 }
-                yield f"data: {json.dumps(error_chunk)}\n\n"
+                yield SSE_PREFIX + orjson.dumps(error_chunk) + SSE_SUFFIX
 
         return StreamingResponse(
             generate(),
@@ -114,22 +115,24 @@ async def chat(request: ChatRequest):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",  # Disable proxy buffering of SSE frames
             }
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Sync for the same reason as /users
 @app.get("/medications")
-async def list_medications():
+def list_medications():
     """Get list of all medications"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute('SELECT * FROM medications')
-        results = cursor.fetchall()
-        conn.close()
+        with DB_LOCK:
+            cursor.execute('SELECT * FROM medications')
+            results = cursor.fetchall()
 
         medications = [
             {
@@ -152,4 +155,14 @@ async def list_medications():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Same worker count as the Docker CMD: uvicorn's CLI also reads
+    # WEB_CONCURRENCY. Each worker has its own httpx pool (up to 100
+    # connections), tool cache and SQLite connection
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
@@ -5,21 +5,286 @@ This module defines all the tools (functions) that the AI agent can use
 to interact with the pharmacy database.
 """
 
+import copy
+import functools
+import inspect
+import json
 import sqlite3
 import os
+import threading
 from typing import Optional, List, Dict, Any
 
+from cachetools import TTLCache
+
 # Get the database path relative to this file
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.dirname(BACKEND_DIR)
 DATABASE_PATH = os.path.join(PROJECT_DIR, 'database', 'pharmacy.db')
 
-def get_db_connection():
-    """Get a connection to the database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Shared read-only connection, opened on first use and reused by every tool
+_CONN: Optional[sqlite3.Connection] = None
+
+# Serializes access to the shared connection across threads
+DB_LOCK = threading.Lock()
+
+def get_db_connection() -> sqlite3.Connection:
+    """Get the shared read-only connection to the database"""
+    global _CONN
+    if _CONN is None:
+        with DB_LOCK:
+            if _CONN is None:
+                conn = sqlite3.connect(
+                    f'file:{DATABASE_PATH}?mode=ro',
+                    uri=True,
+                    check_same_thread=False,
+                    cached_statements=256
+                )
+                conn.row_factory = sqlite3.Row
+                conn.execute('PRAGMA query_only=ON')
+                conn.execute('PRAGMA mmap_size=67108864')
+                conn.execute('PRAGMA cache_size=-20000')
+                _CONN = conn
+    return _CONN
+
+# SQL statements, defined once so the connection's statement cache
+# always sees the same strings
+# Ties within a pass go to the lowest id, matching the batched queries below
+_Q_MED_BY_NAME = '''
+    SELECT * FROM medications
+    WHERE name LIKE ? OR active_ingredient LIKE ?
+    ORDER BY id
+    LIMIT 1
+'''
+
+_Q_STOCK = '''
+    SELECT name, in_stock FROM medications
+    WHERE name LIKE ?
+    ORDER BY id
+    LIMIT 1
+'''
+
+# Batched variants take a JSON array of names and return every candidate row
+# tagged with the index of the name it matched. Like _like_patterns, each is a
+# prefix pass and a substring fallback for the names the first pass missed.
+# LIKE can't use an index against a joined value, so the prefix pass adds the
+# NOCASE range the planner would derive from a bound 'term%' pattern
+_Q_MED_BY_NAMES = ('''
+    SELECT w.key AS idx, m.*
+    FROM json_each(?) w
+    JOIN medications m
+        ON (m.name >= w.value COLLATE NOCASE
+            AND m.name < w.value || char(1114111) COLLATE NOCASE
+            AND m.name LIKE w.value || '%')
+        OR (m.active_ingredient >= w.value COLLATE NOCASE
+            AND m.active_ingredient < w.value || char(1114111) COLLATE NOCASE
+            AND m.active_ingredient LIKE w.value || '%')
+    ORDER BY w.key, m.id
+''', '''
+    SELECT w.key AS idx, m.*
+    FROM json_each(?) w
+    JOIN medications m
+        ON m.name LIKE '%' || w.value || '%'
+        OR m.active_ingredient LIKE '%' || w.value || '%'
+    ORDER BY w.key, m.id
+''')
+
+_Q_STOCK_BY_NAMES = ('''
+    SELECT w.key AS idx, m.name, m.in_stock
+    FROM json_each(?) w
+    JOIN medications m
+        ON m.name >= w.value COLLATE NOCASE
+        AND m.name < w.value || char(1114111) COLLATE NOCASE
+        AND m.name LIKE w.value || '%'
+    ORDER BY w.key, m.id
+''', '''
+    SELECT w.key AS idx, m.name, m.in_stock
+    FROM json_each(?) w
+    JOIN medications m ON m.name LIKE '%' || w.value || '%'
+    ORDER BY w.key, m.id
+''')
+
+_Q_SEARCH_ING = '''
+    SELECT name, active_ingredient, dosage, requires_prescription, in_stock
+    FROM medications
+    WHERE active_ingredient LIKE ?
+'''
+
+_Q_SEARCH_CAT = '''
+    SELECT name, active_ingredient, dosage, requires_prescription, in_stock
+    FROM medications
+    WHERE category LIKE ?
+'''
+
+_Q_SEARCH_ALL = '''
+    SELECT name, active_ingredient, dosage, requires_prescription, in_stock
+    FROM medications
+    ORDER BY name
+'''
+
+_Q_CHECK_PRES = '''
+    SELECT u.name AS user_name,
+           m.id AS medication_id,
+           m.name AS medication_name,
+           m.requires_prescription,
+           (
+               SELECT p.id FROM prescriptions p
+               WHERE p.user_id = u.id AND p.medication_id = m.id
+               ORDER BY p.prescription_date DESC
+               LIMIT 1
+           ) AS prescription_id
+    FROM users u
+    LEFT JOIN (
+        SELECT id, name, requires_prescription
+        FROM medications
+        WHERE name LIKE ?
+        ORDER BY id
+        LIMIT 1
+    ) m ON 1
+    WHERE u.id = ?
+'''
+
+def _like_patterns(term: str) -> tuple:
+    """
+    LIKE patterns to try in order: an indexed prefix match first,
+    then a substring match as a fallback.
+    """
+    return (f'{term}%', f'%{term}%')
+
+def _normalize_arg(value: Any) -> Any:
+    """Normalize a tool argument for use in a cache key"""
+    return value.strip().lower() if isinstance(value, str) else value
+
+def _cached_tool(func):
+    """
+    Cache successful tool results for a short time, keyed on the tool's arguments.
+
+    String arguments are normalized so "Advil", "advil " and "ADVIL" share
+    one entry. Failed lookups are not cached, and callers get a copy so
+    cached results can't be mutated.
+    """
+    signature = inspect.signature(func)
+    cache = TTLCache(maxsize=256, ttl=60)
+    lock = threading.Lock()
+
+    def cache_key(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple(_normalize_arg(value) for value in bound.arguments.values())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = cache_key(*args, **kwargs)
+
+        with lock:
+            result = cache.get(key)
+
+        if result is None:
+            result = func(*args, **kwargs)
+            if result.get('success'):
+                with lock:
+                    cache[key] = result
+
+        return copy.deepcopy(result)
+
+    wrapper.cache = cache
+    wrapper.cache_key = cache_key
+    wrapper.cache_lock = lock
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+def _cached_batch(single_tool):
+    """
+    Share single_tool's cache with a batched version of it.
+
+    Names already cached are answered from the cache and only the misses
+    are queried; successful results are stored back, so a later single
+    call for the same name is a cache hit too.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(medication_names: List[str]) -> List[Dict[str, Any]]:
+            keys = [single_tool.cache_key(medication_name) for medication_name in medication_names]
+
+            with single_tool.cache_lock:
+                results = [single_tool.cache.get(key) for key in keys]
+
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                fetched = func([medication_names[i] for i in misses])
+                with single_tool.cache_lock:
+                    for i, result in zip(misses, fetched):
+                        results[i] = result
+                        if result.get('success'):
+                            single_tool.cache[keys[i]] = result
+
+            return copy.deepcopy(results)
+
+        return wrapper
+    return decorator
+
+def _medication_result(result: Optional[sqlite3.Row], medication_name: str) -> Dict[str, Any]:
+    """Build the get_medication_by_name response for a fetched row"""
+    if result:
+        return {
+            'success': True,
+            'medication': {
+                'id': result['id'],
+                'name': result['name'],
+                'active_ingredient': result['active_ingredient'],
+                'dosage': result['dosage'],
+                'requires_prescription': bool(result['requires_prescription']),
+                'in_stock': bool(result['in_stock']),
+                'usage_instructions': result['usage_instructions'],
+                'side_effects': result['side_effects'],
+                'description': result['description'],
+                'category': result['category']
+            }
+        }
+    else:
+        return {
+            'success': False,
+            'error': f'Medication "{medication_name}" not found. Please check spelling or try another name.',
+            'suggestion': 'Try searching by active ingredient or category.'
+        }
+
+def _stock_result(result: Optional[sqlite3.Row], medication_name: str) -> Dict[str, Any]:
+    """Build the check_medication_stock response for a fetched row"""
+    if result:
+        in_stock = bool(result['in_stock'])
+
+        return {
+            'success': True,
+            'medication_name': result['name'],
+            'in_stock': in_stock,
+            'message': f'Yes, {result["name"]} is in stock.' if in_stock else f'No, {result["name"]} is out of stock.'
+        }
+    else:
+        return {
+            'success': False,
+            'error': f'Medication "{medication_name}" not found.'
+        }
+
+def _fetch_first_matches(queries: tuple, medication_names: List[str]) -> List[Optional[sqlite3.Row]]:
+    """Run a batched lookup's passes and return the best matching row for each name, in order"""
+    conn = get_db_connection()
+    matches = [None] * len(medication_names)
+    pending = list(range(len(medication_names)))
 
+    with DB_LOCK:
+        for sql in queries:
+            names = [medication_names[i] for i in pending]
+            for row in conn.execute(sql, (json.dumps(names),)):
+                i = pending[row['idx']]
+                if matches[i] is None:
+                    matches[i] = row
+
+            pending = [i for i in pending if matches[i] is None]
+            if not pending:
+                break
+
+    return matches
+
+@_cached_tool
 def get_medication_by_name(medication_name: str) -> Dict[str, Any]:
     """
     Search for a medication by name.
@@ -34,43 +299,23 @@ def get_medication_by_name(medication_name: str) -> Dict[str, Any]:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Search with LIKE for partial matches
-        cursor.execute('''
-            SELECT * FROM medications
-            WHERE name LIKE ? OR active_ingredient LIKE ?
-        ''', (f'%{medication_name}%', f'%{medication_name}%'))
+        # Search with LIKE - prefix match first, then partial matches
+        with DB_LOCK:
+            for pattern in _like_patterns(medication_name):
+                cursor.execute(_Q_MED_BY_NAME, (pattern, pattern))
 
-        result = cursor.fetchone()
-        conn.close()
+                result = cursor.fetchone()
+                if result:
+                    break
 
-        if result:
-            return {
-                'success': True,
-                'medication': {
-                    'id': result['id'],
-                    'name': result['name'],
-                    'active_ingredient': result['active_ingredient'],
-                    'dosage': result['dosage'],
-                    'requires_prescription': bool(result['requires_prescription']),
-                    'in_stock': bool(result['in_stock']),
-                    'usage_instructions': result['usage_instructions'],
-                    'side_effects': result['side_effects'],
-                    'description': result['description'],
-                    'category': result['category']
-                }
-            }
-        else:
-            return {
-                'success': False,
-                'error': f'Medication "{medication_name}" not found. Please check spelling or try another name.',
-                'suggestion': 'Try searching by active ingredient or category.'
-            }
+        return _medication_result(result, medication_name)
     except Exception as e:
         return {
             'success': False,
             'error': f'Search error: {str(e)}'
         }
 
+@_cached_tool
 def check_medication_stock(medication_name: str) -> Dict[str, Any]:
     """
     Check if a medication is in stock.
@@ -85,34 +330,74 @@ def check_medication_stock(medication_name: str) -> Dict[str, Any]:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT name, in_stock FROM medications
-            WHERE name LIKE ?
-        ''', (f'%{medication_name}%',))
-
-        result = cursor.fetchone()
-        conn.close()
+        with DB_LOCK:
+            for pattern in _like_patterns(medication_name):
+                cursor.execute(_Q_STOCK, (pattern,))
 
-        if result:
-            in_stock = bool(result['in_stock'])
+                result = cursor.fetchone()
+                if result:
+                    break
 
-            return {
-                'success': True,
-                'medication_name': result['name'],
-                'in_stock': in_stock,
-                'message': f'Yes, {result["name"]} is in stock.' if in_stock else f'No, {result["name"]} is out of stock.'
-            }
-        else:
-            return {
-                'success': False,
-                'error': f'Medication "{medication_name}" not found.'
-            }
+        return _stock_result(result, medication_name)
     except Exception as e:
         return {
             'success': False,
             'error': f'Error checking stock: {str(e)}'
         }
 
+@_cached_batch(get_medication_by_name)
+def get_medications_by_names(medication_names: List[str]) -> List[Dict[str, Any]]:
+    """
+    Look up several medications by name with a single query.
+
+    Args:
+        medication_names: The names of the medications to search for
+
+    Returns:
+        One get_medication_by_name response per name, in the same order
+    """
+    try:
+        matches = _fetch_first_matches(_Q_MED_BY_NAMES, medication_names)
+        return [
+            _medication_result(result, medication_name)
+            for result, medication_name in zip(matches, medication_names)
+        ]
+    except Exception as e:
+        return [
+            {
+                'success': False,
+                'error': f'Search error: {str(e)}'
+            }
+            for _ in medication_names
+        ]
+
+@_cached_batch(check_medication_stock)
+def check_medications_stock(medication_names: List[str]) -> List[Dict[str, Any]]:
+    """
+    Check stock for several medications with a single query.
+
+    Args:
+        medication_names: The names of the medications
+
+    Returns:
+        One check_medication_stock response per name, in the same order
+    """
+    try:
+        matches = _fetch_first_matches(_Q_STOCK_BY_NAMES, medication_names)
+        return [
+            _stock_result(result, medication_name)
+            for result, medication_name in zip(matches, medication_names)
+        ]
+    except Exception as e:
+        return [
+            {
+                'success': False,
+                'error': f'Error checking stock: {str(e)}'
+            }
+            for _ in medication_names
+        ]
+
+@_cached_tool
 def search_medications(filter_type: str = "all", query: str = "") -> Dict[str, Any]:
     """
     Search for medications with various filters.
@@ -128,27 +413,19 @@ def search_medications(filter_type: str = "all", query: str = "") -> Dict[str, A
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        if filter_type == "ingredient":
-            cursor.execute('''
-                SELECT name, active_ingredient, dosage, requires_prescription, in_stock
-                FROM medications
-                WHERE active_ingredient LIKE ?
-            ''', (f'%{query}%',))
-        elif filter_type == "category":
-            cursor.execute('''
-                SELECT name, active_ingredient, dosage, requires_prescription, in_stock
-                FROM medications
-                WHERE category LIKE ?
-            ''', (f'%{query}%',))
-        else:  # "all"
-            cursor.execute('''
-                SELECT name, active_ingredient, dosage, requires_prescription, in_stock
-                FROM medications
-                ORDER BY name
-            ''')
-
-        results = cursor.fetchall()
-        conn.close()
+        with DB_LOCK:
+            if filter_type in ("ingredient", "category"):
+                sql = _Q_SEARCH_ING if filter_type == "ingredient" else _Q_SEARCH_CAT
+                for pattern in _like_patterns(query):
+                    cursor.execute(sql, (pattern,))
+
+                    results = cursor.fetchall()
+                    if results:
+                        break
+            else:  # "all"
+                cursor.execute(_Q_SEARCH_ALL)
+
+                results = cursor.fetchall()
 
         if results:
             medications = [
@@ -180,6 +457,7 @@ def search_medications(filter_type: str = "all", query: str = "") -> Dict[str, A
             'error': f'Error searching medications: {str(e)}'
         }
 
+@_cached_tool
 def check_prescription(user_id: int, medication_name: str) -> Dict[str, Any]:
     """
     Check prescription status for a user and medication.
@@ -196,51 +474,32 @@ def check_prescription(user_id: int, medication_name: str) -> Dict[str, Any]:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Get user info
-        cursor.execute('SELECT name FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
+        # Look up the user, the medication and the user's latest prescription
+        # for it in a single query
+        with DB_LOCK:
+            for pattern in _like_patterns(medication_name):
+                cursor.execute(_Q_CHECK_PRES, (pattern, user_id))
+
+                row = cursor.fetchone()
+                if not row or row['medication_id'] is not None:
+                    break
 
-        if not user:
-            conn.close()
+        if not row:
             return {
                 'success': False,
                 'error': f'User #{user_id} not found in the system.'
             }
 
-        user_name = user['name']
-
-        # Find medication
-        cursor.execute('''
-            SELECT id, name, requires_prescription
-            FROM medications
-            WHERE name LIKE ?
-        ''', (f'%{medication_name}%',))
-
-        medication = cursor.fetchone()
-
-        if not medication:
-            conn.close()
+        if row['medication_id'] is None:
             return {
                 'success': False,
                 'error': f'Medication "{medication_name}" not found in the system.'
             }
 
-        medication_id = medication['id']
-        medication_full_name = medication['name']
-        requires_prescription = bool(medication['requires_prescription'])
-
-        # Check if user has prescription
-        cursor.execute('''
-            SELECT p.*, m.name as medication_name
-            FROM prescriptions p
-            JOIN medications m ON p.medication_id = m.id
-            WHERE p.user_id = ? AND p.medication_id = ?
-            ORDER BY p.prescription_date DESC
-            LIMIT 1
-        ''', (user_id, medication_id))
-
-        prescription = cursor.fetchone()
-        conn.close()
+        user_name = row['user_name']
+        medication_full_name = row['medication_name']
+        requires_prescription = bool(row['requires_prescription'])
+        prescription = row['prescription_id'] is not None
 
         if prescription:
             return {
@@ -365,3 +624,10 @@ TOOL_FUNCTIONS = {
     "check_medication_stock": check_medication_stock,
     "check_prescription": check_prescription
 }
+
+# Tools that can serve several calls of the same kind with one query,
+# taking the list of medication names in call order
+BATCH_TOOL_FUNCTIONS = {
+    "get_medication_by_name": get_medications_by_names,
+    "check_medication_stock": check_medications_stock
+}
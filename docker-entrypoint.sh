@@ -1,15 +1,12 @@
 #!/bin/bash
 set -e
 
-# Initialize database if it doesn't exist
-if [ ! -f /app/database/pharmacy.db ]; then
-    echo "Initializing database..."
-    cd /app/database
-    python init_db.py
-    cd /app/backend
-else
-    echo "Database already exists, skipping initialization..."
-fi
+# Initialize the database; init_db.py is a quick no-op when it is already
+# seeded, and recovers a file left half-written by an interrupted start
+echo "Initializing database..."
+cd /app/database
+python init_db.py
+cd /app/backend
 
 # Execute the main command (uvicorn)
 exec "$@"
@@ -178,6 +178,8 @@ async function streamChat(typingEl) {
 
   let toolCalls = [];
   let toolResults = [];
+  // Tool calls still streaming in the current round, keyed by stream index
+  let openToolCalls = {};
 
   let hasStartedContent = false;
   let finalized = false;
@@ -229,11 +231,21 @@ async function streamChat(typingEl) {
         assistantMessage += parsed.content;
         updateMessageContent(currentMessageElement, assistantMessage);
 
-      } else if (parsed.type === 'tool_call') {
-        const tc = parsed.tool_call;
-        if (tc?.id && tc?.function?.name) {
-          if (!toolCalls.find(x => x.id === tc.id)) toolCalls.push(tc);
-        }
+      } else if (parsed.type === 'tool_call_start') {
+        const tc = {
+          id: parsed.id,
+          type: 'function',
+          function: { name: parsed.name, arguments: '' }
+        };
+        openToolCalls[parsed.index] = tc;
+        toolCalls.push(tc);
+
+      } else if (parsed.type === 'tool_call_delta') {
+        const tc = openToolCalls[parsed.index];
+        if (tc) tc.function.arguments += parsed.arguments_delta;
+
+      } else if (parsed.type === 'tool_call_end') {
+        delete openToolCalls[parsed.index];
 
       } else if (parsed.type === 'tool_result') {
         toolResults.push(parsed);